@@ -4,10 +4,12 @@ MCP Food Tracking Server
 A Model Context Protocol server for logging and analyzing food/nutrition data.
 """
 
+import hashlib
 import json
 import os
+from contextlib import nullcontext
 from datetime import datetime
-from typing import Any, List, Dict, Optional
+from typing import Any, Iterable, Iterator, List, Dict, Optional
 from pathlib import Path
 
 from fastmcp import FastMCP
@@ -30,112 +32,437 @@ class Meal(BaseModel):
     time: Optional[str] = None
     total_calories: Optional[float] = None
     total_protein_g: Optional[float] = None
+    total_carbs_g: Optional[float] = None
+    total_fat_g: Optional[float] = None
+    idempotency_key: Optional[str] = None
     ingredients: List[Ingredient]
 
 
+class NutrientRollup(BaseModel):
+    """Macro totals for every meal, day, ingredient category and ingredient.
+
+    A total is None when no ingredient in the group has a value for it.
+    """
+    per_meal: List[Dict[str, Optional[float]]]
+    per_day: Dict[str, Dict[str, Optional[float]]]
+    per_category: Dict[str, Dict[str, Optional[float]]]
+    per_ingredient: Dict[str, Dict[str, Optional[float]]]
+    meals_per_day: Dict[str, int]
+    ingredient_counts: Dict[str, int]
+    total: Dict[str, Optional[float]]
+
+
 # Data directory
 DATA_DIR = Path("data")
 FOOD_LOG_FILE = DATA_DIR / "food_log.md"
+FOOD_LOG_INDEX_FILE = DATA_DIR / "food_log.index"
 DATA_DIR.mkdir(exist_ok=True)
 
+MEAL_START = "### MEAL START"
+MEAL_END = "### MEAL END"
+NUTRIENT_FIELDS = ("calories", "protein_g", "carbs_g", "fat_g")
+
+# Ingredient table header -> Ingredient field. Older entries only have the
+# first four columns; columns are looked up by header so both formats parse.
+TABLE_COLUMNS = {
+    "Ingredient": "name",
+    "Category": "category",
+    "Calories": "calories",
+    "Protein (g)": "protein_g",
+    "Carbs (g)": "carbs_g",
+    "Fat (g)": "fat_g",
+}
+
 # Ensure food log file exists
 if not FOOD_LOG_FILE.exists():
     FOOD_LOG_FILE.write_text("# Food Log\n\n")
 
+# In-memory copy of the hash index, loaded lazily on first use, and the
+# (size, mtime) of the food log it was built against
+_meal_index: Optional[set] = None
+_meal_index_stamp: Optional[str] = None
 
-def parse_food_log() -> List[Meal]:
-    """Parse the food log markdown file into Meal objects."""
+
+def _iter_log_chunks(f):
+    """Stream the food log, yielding (lines, is_meal_block) chunks.
+
+    Blank lines preceding a meal block are attached to that block so that
+    dropping a block does not leave stray whitespace behind. A block missing
+    its MEAL END line is closed by the next MEAL START.
+    """
+    pending = []
+    block = None
+    for line in f:
+        if block is None:
+            if line.startswith(MEAL_START):
+                block = pending + [line]
+                pending = []
+            elif line.strip():
+                yield pending + [line], False
+                pending = []
+            else:
+                pending.append(line)
+        elif line.startswith(MEAL_START):
+            yield block, True
+            block = [line]
+        else:
+            block.append(line)
+            if line.startswith(MEAL_END):
+                yield block, True
+                block = None
+    if block is not None:
+        yield block, True
+    if pending:
+        yield pending, False
+
+
+def _parse_meal_block(block_lines: List[str]) -> Optional[Meal]:
+    """Parse the lines of a single MEAL START/END block into a Meal."""
+    metadata = {}
+    table_lines = []
+
+    for line in block_lines:
+        line = line.strip()
+        if line.startswith("**"):
+            colon_index = line.find(':')
+            if colon_index != -1:
+                key_str = line[:colon_index]
+                value_str = line[colon_index+1:]
+
+                key = key_str.replace("**", "").strip().lower().replace(" ", "_").replace("(", "").replace(")", "")
+                value = value_str.replace("**", "").strip()
+                metadata[key] = value
+        elif line.startswith("|") and '---' not in line:
+            table_lines.append(line)
+
+    # Parse ingredients table
+    ingredients = []
+    if table_lines and len(table_lines) > 1:
+        header_line = table_lines[0]
+        header = [h.strip() for h in header_line.strip('|').split('|')]
+
+        # Map column positions to Ingredient fields once per block
+        columns = [(idx, TABLE_COLUMNS[h]) for idx, h in enumerate(header) if h in TABLE_COLUMNS]
+        if "name" not in (field for _, field in columns):
+            return None
+
+        for row_line in table_lines[1:]:
+            row = [r.strip() for r in row_line.strip('|').split('|')]
+            if len(row) >= len(header):
+                try:
+                    ingredient_data = {}
+                    for idx, field in columns:
+                        cell = row[idx]
+                        if field in NUTRIENT_FIELDS:
+                            ingredient_data[field] = float(cell) if cell and cell != '-' else None
+                        elif field == "category":
+                            ingredient_data[field] = cell or None
+                        else:
+                            ingredient_data[field] = cell
+                    ingredients.append(Ingredient(**ingredient_data))
+                except (ValueError, IndexError):
+                    continue
+
+    if not ingredients:
+        return None
+
+    totals = {}
+    for field in NUTRIENT_FIELDS:
+        value = metadata.get(f"total_{field}")
+        totals[f"total_{field}"] = float(value) if value and value != '-' else None
+
+    return Meal(
+        query=metadata.get("query"),
+        meal_type=metadata.get("meal"),
+        date=metadata.get("date"),
+        time=metadata.get("time"),
+        **totals,
+        idempotency_key=metadata.get("idempotency_key"),
+        ingredients=ingredients
+    )
+
+
+def iter_food_log() -> Iterator[Meal]:
+    """Stream Meal objects from the food log without loading it whole."""
     try:
         with open(FOOD_LOG_FILE, "r") as f:
-            content = f.read()
+            for lines, is_meal in _iter_log_chunks(f):
+                if is_meal:
+                    meal = _parse_meal_block(lines)
+                    if meal:
+                        yield meal
     except FileNotFoundError:
-        return []
+        return
 
-    meal_blocks = content.strip().split("### MEAL START")[1:]
-    parsed_meals = []
 
-    for block in meal_blocks:
-        block = block.strip().replace("### MEAL END", "").strip()
-        lines = block.split('\n')
+def parse_food_log() -> List[Meal]:
+    """Parse the food log markdown file into Meal objects."""
+    return list(iter_food_log())
 
-        metadata = {}
-        table_lines = []
-        
-        for line in lines:
-            if line.startswith("**"):
-                colon_index = line.find(':')
-                if colon_index != -1:
-                    key_str = line[:colon_index]
-                    value_str = line[colon_index+1:]
-                    
-                    key = key_str.replace("**", "").strip().lower().replace(" ", "_").replace("(", "").replace(")", "")
-                    value = value_str.replace("**", "").strip()
-                    metadata[key] = value
-            elif line.startswith("|") and '---' not in line:
-                table_lines.append(line)
-
-        # Parse ingredients table
-        ingredients = []
-        if table_lines and len(table_lines) > 1:
-            header_line = table_lines[0]
-            header = [h.strip() for h in header_line.strip('|').split('|')]
-            
-            try:
-                name_idx = header.index("Ingredient")
-                cat_idx = header.index("Category")
-                cal_idx = header.index("Calories")
-                prot_idx = header.index("Protein (g)")
-            except ValueError:
+
+def aggregate_nutrients(meals: Iterable[Meal]) -> NutrientRollup:
+    """Roll up every macro per meal, day, category and ingredient in one pass.
+
+    Ingredient values are summed rather than trusting the meal's stored
+    totals, so the per-category figures always add up to the per-day ones.
+    Unknown values are skipped; a total stays None until a value is seen.
+    """
+    per_meal = []
+    per_day = {}
+    per_category = {}
+    per_ingredient = {}
+    meals_per_day = {}
+    ingredient_counts = {}
+    total = dict.fromkeys(NUTRIENT_FIELDS)
+
+    for meal in meals:
+        meal_totals = dict.fromkeys(NUTRIENT_FIELDS)
+        for ing in meal.ingredients:
+            category_totals = per_category.setdefault(ing.category or "Uncategorized", dict.fromkeys(NUTRIENT_FIELDS))
+            ingredient_totals = per_ingredient.setdefault(ing.name, dict.fromkeys(NUTRIENT_FIELDS))
+            ingredient_counts[ing.name] = ingredient_counts.get(ing.name, 0) + 1
+            for field in NUTRIENT_FIELDS:
+                value = getattr(ing, field)
+                if value is None:
+                    continue
+                for group_totals in (meal_totals, category_totals, ingredient_totals):
+                    group_totals[field] = (group_totals[field] or 0.0) + value
+
+        date = meal.date or "unknown"
+        day_totals = per_day.setdefault(date, dict.fromkeys(NUTRIENT_FIELDS))
+        for field in NUTRIENT_FIELDS:
+            value = meal_totals[field]
+            if value is None:
                 continue
+            for group_totals in (day_totals, total):
+                group_totals[field] = (group_totals[field] or 0.0) + value
+        meals_per_day[date] = meals_per_day.get(date, 0) + 1
+        per_meal.append(meal_totals)
+
+    return NutrientRollup(
+        per_meal=per_meal,
+        per_day=per_day,
+        per_category=per_category,
+        per_ingredient=per_ingredient,
+        meals_per_day=meals_per_day,
+        ingredient_counts=ingredient_counts,
+        total=total
+    )
+
+
+def _normalize_number(value: Any) -> float:
+    """Coerce a nutrient value to float, treating missing values as 0."""
+    if value in (None, "", "-"):
+        return 0.0
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def meal_content_hash(
+    query: Optional[str],
+    meal_type: Optional[str],
+    date: Optional[str],
+    time: Optional[str],
+    ingredients: List[Dict[str, Any]]
+) -> str:
+    """Compute a canonical SHA-256 hash over a meal's content.
+
+    Values are normalized the same way whether they come from a tool call or
+    from parsing the log, so a retried call hashes identically to the entry
+    it already wrote. Ingredient order does not affect the hash.
+    """
+    canonical_ingredients = sorted(
+        (
+            {
+                "name": str(ing.get("name") or "").strip(),
+                "category": str(ing.get("category") or "").strip(),
+                **{field: _normalize_number(ing.get(field)) for field in NUTRIENT_FIELDS},
+            }
+            for ing in ingredients
+        ),
+        key=lambda ing: json.dumps(ing, sort_keys=True),
+    )
+    payload = {
+        "query": str(query or "").strip().strip('"').strip(),
+        "meal_type": str(meal_type or "").strip().lower(),
+        "date": str(date or "").strip(),
+        "time": str(time or "").strip(),
+        "ingredients": canonical_ingredients,
+    }
+    canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def _idempotency_digest(idempotency_key: str) -> str:
+    """Hash an idempotency key into the same namespace as content hashes."""
+    return hashlib.sha256(f"idempotency-key:{idempotency_key}".encode("utf-8")).hexdigest()
+
+
+def _meal_digests(meal: Meal) -> List[str]:
+    """Return the index entries identifying a parsed meal."""
+    digests = [meal_content_hash(
+        meal.query,
+        meal.meal_type,
+        meal.date,
+        meal.time,
+        [ing.model_dump() for ing in meal.ingredients]
+    )]
+    if meal.idempotency_key:
+        digests.append(_idempotency_digest(meal.idempotency_key))
+    return digests
+
+
+def _food_log_stamp() -> str:
+    """Identify the current state of the food log by its size and mtime."""
+    try:
+        stat = FOOD_LOG_FILE.stat()
+    except FileNotFoundError:
+        return "0 0"
+    return f"{stat.st_size} {stat.st_mtime_ns}"
+
+
+def _write_meal_index(digests: set) -> None:
+    """Atomically replace the on-disk hash index.
+
+    The index ends with a '# <size> <mtime>' stamp line for the food log it
+    matches. Appends add further stamp lines; the last one is current.
+    """
+    global _meal_index, _meal_index_stamp
+    stamp = _food_log_stamp()
+    tmp_file = FOOD_LOG_INDEX_FILE.with_name(FOOD_LOG_INDEX_FILE.name + ".tmp")
+    tmp_file.write_text("".join(f"{digest}\n" for digest in sorted(digests)) + f"# {stamp}\n")
+    os.replace(tmp_file, FOOD_LOG_INDEX_FILE)
+    _meal_index = digests
+    _meal_index_stamp = stamp
+
+
+def _append_meal_index(digests: List[str]) -> None:
+    """Append digests for a newly logged meal to the index."""
+    global _meal_index_stamp
+    stamp = _food_log_stamp()
+    with open(FOOD_LOG_INDEX_FILE, "a") as f:
+        f.writelines(f"{digest}\n" for digest in digests)
+        f.write(f"# {stamp}\n")
+    _meal_index.update(digests)
+    _meal_index_stamp = stamp
+
+
+def rebuild_meal_index() -> set:
+    """Rebuild the hash index from the food log and persist it."""
+    digests = set()
+    for meal in parse_food_log():
+        digests.update(_meal_digests(meal))
+    _write_meal_index(digests)
+    return digests
+
+
+def load_meal_index() -> set:
+    """Return the set of known meal digests.
+
+    The index is rebuilt from the log if it is missing or if the log has
+    changed since the index was last written (e.g. edited by hand).
+    """
+    global _meal_index, _meal_index_stamp
+    stamp = _food_log_stamp()
+    if _meal_index is not None and _meal_index_stamp == stamp:
+        return _meal_index
+
+    digests = set()
+    stored_stamp = None
+    try:
+        with open(FOOD_LOG_INDEX_FILE, "r") as f:
+            for line in f:
+                line = line.strip()
+                if line.startswith("#"):
+                    stored_stamp = line[1:].strip()
+                elif line:
+                    digests.add(line)
+    except FileNotFoundError:
+        pass
 
-            for row_line in table_lines[1:]:
-                row = [r.strip() for r in row_line.strip('|').split('|')]
-                if len(row) >= len(header):
-                    try:
-                        ingredient_data = {
-                            "name": row[name_idx],
-                            "category": row[cat_idx] if cat_idx < len(row) and row[cat_idx] else None,
-                            "calories": float(row[cal_idx]) if cal_idx < len(row) and row[cal_idx] and row[cal_idx] != '-' else None,
-                            "protein_g": float(row[prot_idx]) if prot_idx < len(row) and row[prot_idx] and row[prot_idx] != '-' else None,
-                        }
-                        ingredients.append(Ingredient(**ingredient_data))
-                    except (ValueError, IndexError):
+    if stored_stamp == stamp:
+        _meal_index = digests
+        _meal_index_stamp = stamp
+        return _meal_index
+    return rebuild_meal_index()
+
+
+def remove_duplicate_meals(dry_run: bool = False) -> List[Meal]:
+    """Drop repeated meal entries from the food log in one streaming pass.
+
+    The first occurrence of each meal is kept. A later entry counts as a
+    duplicate if its content hash or its idempotency key was already seen.
+    The hash index is rewritten from the surviving entries.
+
+    Returns:
+        The duplicate meals that were (or, with dry_run, would be) removed.
+    """
+    seen = set()
+    duplicates = []
+    tmp_file = FOOD_LOG_FILE.with_name(FOOD_LOG_FILE.name + ".tmp")
+
+    try:
+        src = open(FOOD_LOG_FILE, "r")
+    except FileNotFoundError:
+        return []
+
+    try:
+        # A dry run only scans the log; nothing is written
+        with src, (nullcontext() if dry_run else open(tmp_file, "w")) as dst:
+            for lines, is_meal in _iter_log_chunks(src):
+                meal = _parse_meal_block(lines) if is_meal else None
+                if meal:
+                    digests = _meal_digests(meal)
+                    if any(digest in seen for digest in digests):
+                        duplicates.append(meal)
                         continue
+                    seen.update(digests)
+                if dst:
+                    dst.writelines(lines)
 
-        if ingredients:
-            total_calories = metadata.get("total_calories")
-            total_protein_g = metadata.get("total_protein_g")
-            
-            meal = Meal(
-                query=metadata.get("query"),
-                meal_type=metadata.get("meal"),
-                date=metadata.get("date"),
-                time=metadata.get("time"),
-                total_calories=float(total_calories) if total_calories else None,
-                total_protein_g=float(total_protein_g) if total_protein_g else None,
-                ingredients=ingredients
-            )
-            parsed_meals.append(meal)
+        if duplicates and not dry_run:
+            os.replace(tmp_file, FOOD_LOG_FILE)
+            _write_meal_index(seen)
+    finally:
+        if tmp_file.exists():
+            tmp_file.unlink()
 
-    return parsed_meals
+    return duplicates
 
 
 def add_meal_to_log(meal_data: Dict[str, Any]) -> str:
     """Add a new meal entry to the food log."""
     try:
         # Parse the meal data
-        query = meal_data.get("query", "")
-        meal_type = meal_data.get("meal_type", "")
-        ingredients = meal_data.get("ingredients", [])
+        # Missing values are written as empty strings so that the hash of
+        # this call matches the hash of the entry when parsed back
+        query = (meal_data.get("query") or "").strip()
+        meal_type = meal_data.get("meal_type") or ""
+        ingredients = meal_data.get("ingredients") or []
+        idempotency_key = (meal_data.get("idempotency_key") or "").strip()
         
         # Get current timestamp if not provided
         now = datetime.now()
-        date = meal_data.get("date", now.strftime("%Y-%m-%d"))
-        time = meal_data.get("time", now.strftime("%H:%M"))
+        date = meal_data.get("date") or now.strftime("%Y-%m-%d")
+        time = meal_data.get("time") or now.strftime("%H:%M")
+        
+        # Skip exact retries and previously seen idempotency keys
+        digests = [meal_content_hash(query, meal_type, date, time, ingredients)]
+        if idempotency_key:
+            digests.append(_idempotency_digest(idempotency_key))
+        index = load_meal_index()
+        if any(digest in index for digest in digests):
+            return f"Meal already logged: {meal_type} on {date} at {time} (duplicate skipped)"
+        
+        # Calculate totals, written as '-' when no ingredient has a value
+        totals = {}
+        for field in NUTRIENT_FIELDS:
+            values = [ing.get(field) for ing in ingredients if ing.get(field) is not None]
+            totals[field] = sum(values) if values else "-"
         
-        # Calculate totals
-        total_calories = sum(ing.get("calories", 0) for ing in ingredients if ing.get("calories"))
-        total_protein = sum(ing.get("protein_g", 0) for ing in ingredients if ing.get("protein_g"))
+        key_line = f"**Idempotency Key:** {idempotency_key}\n" if idempotency_key else ""
         
         # Format the meal entry
         meal_entry = f"""
@@ -144,19 +471,23 @@ def add_meal_to_log(meal_data: Dict[str, Any]) -> str:
 **Meal:** {meal_type}
 **Date:** {date}
 **Time:** {time}
-**Total Calories:** {total_calories}
-**Total Protein (g):** {total_protein}
-
-| Ingredient         | Category | Calories | Protein (g) |
-|--------------------|----------|----------|-------------|
+**Total Calories:** {totals["calories"]}
+**Total Protein (g):** {totals["protein_g"]}
+**Total Carbs (g):** {totals["carbs_g"]}
+**Total Fat (g):** {totals["fat_g"]}
+{key_line}
+| Ingredient         | Category | Calories | Protein (g) | Carbs (g) | Fat (g) |
+|--------------------|----------|----------|-------------|-----------|---------|
 """
         
         for ing in ingredients:
-            name = ing.get("name", "")
-            category = ing.get("category", "")
-            calories = ing.get("calories", 0)
-            protein = ing.get("protein_g", 0)
-            meal_entry += f"| {name:<18} | {category:<8} | {calories:<8} | {protein:<11} |\n"
+            name = ing.get("name") or ""
+            category = ing.get("category") or ""
+            # Unknown values are written as '-' so they parse back as None
+            calories, protein, carbs, fat = (
+                "-" if ing.get(field) is None else ing.get(field) for field in NUTRIENT_FIELDS
+            )
+            meal_entry += f"| {name:<18} | {category:<8} | {calories:<8} | {protein:<11} | {carbs:<9} | {fat:<7} |\n"
         
         meal_entry += "### MEAL END\n\n"
         
@@ -164,6 +495,9 @@ def add_meal_to_log(meal_data: Dict[str, Any]) -> str:
         with open(FOOD_LOG_FILE, "a") as f:
             f.write(meal_entry)
         
+        # Record the new entry in the hash index
+        _append_meal_index(digests)
+        
         return f"Successfully logged meal: {meal_type} on {date} at {time}"
     
     except Exception as e:
@@ -180,23 +514,28 @@ def add_food_entry(
     ingredients: List[Dict[str, Any]],
     meal_type: Optional[str] = None,
     date: Optional[str] = None,
-    time: Optional[str] = None
+    time: Optional[str] = None,
+    idempotency_key: Optional[str] = None
 ) -> str:
     """Log a new food/meal entry with ingredients and nutrition data.
     
+    Retrying an identical entry, or reusing an idempotency key, is a no-op.
+    
     Args:
         query: Original user query describing the meal
         ingredients: List of ingredients with nutrition information
         meal_type: Type of meal (breakfast, lunch, dinner, snack)
         date: Date of the meal (YYYY-MM-DD format)
         time: Time of the meal (HH:MM format)
+        idempotency_key: Unique key for this request; repeats are ignored (optional)
     """
     meal_data = {
         "query": query,
         "meal_type": meal_type,
         "date": date,
         "time": time,
-        "ingredients": ingredients
+        "ingredients": ingredients,
+        "idempotency_key": idempotency_key
     }
     return add_meal_to_log(meal_data)
 
@@ -229,64 +568,127 @@ def get_food_log(
         for meal in meals:
             result += f"**{meal.meal_type}** on {meal.date} at {meal.time}\n"
             result += f"Query: {meal.query}\n"
-            result += f"Total Calories: {meal.total_calories}, Protein: {meal.total_protein_g}g\n"
+            totals = [
+                f"{label}: {value}{unit}"
+                for label, value, unit in (
+                    ("Total Calories", meal.total_calories, ""),
+                    ("Protein", meal.total_protein_g, "g"),
+                    ("Carbs", meal.total_carbs_g, "g"),
+                    ("Fat", meal.total_fat_g, "g"),
+                )
+                if value is not None
+            ]
+            if totals:
+                result += ", ".join(totals) + "\n"
             result += f"Ingredients: {', '.join([ing.name for ing in meal.ingredients])}\n\n"
         return result
 
 
-# @mcp.tool()
-# def analyze_nutrition(
-#     analysis_type: str,
-#     date_range: Optional[str] = None
-# ) -> str:
-#     """Analyze nutrition trends and provide insights from food log.
+@mcp.tool()
+def deduplicate_food_log(dry_run: bool = True) -> str:
+    """Report and remove duplicate food entries from the log.
+    
+    Args:
+        dry_run: Only report duplicates without modifying the log (default True)
+    """
+    duplicates = remove_duplicate_meals(dry_run=dry_run)
+    
+    if not duplicates:
+        return "No duplicate food entries found."
+    else:
+        action = "Would remove" if dry_run else "Removed"
+        result = f"{action} {len(duplicates)} duplicate entries:\n\n"
+        for meal in duplicates:
+            result += f"**{meal.meal_type}** on {meal.date} at {meal.time}: {meal.query}\n"
+        return result
+
+
+def _parse_date_range(date_range: str) -> tuple:
+    """Parse 'YYYY-MM-DD' or 'YYYY-MM-DD to YYYY-MM-DD' into (start, end).
+
+    Raises:
+        ValueError: If either date is not in YYYY-MM-DD format.
+    """
+    start, _, end = date_range.partition(" to ")
+    start, end = start.strip(), (end.strip() or start.strip())
+    for value in (start, end):
+        datetime.strptime(value, "%Y-%m-%d")
+    return start, end
+
+
+def _format_nutrients(totals: Dict[str, Optional[float]], calorie_share: Optional[float] = None) -> str:
+    """Format macro totals for display, showing missing totals as unknown."""
+    def fmt(field: str, spec: str, unit: str) -> str:
+        value = totals[field]
+        return "unknown" if value is None else f"{value:{spec}}{unit}"
     
-#     Args:
-#         analysis_type: Type of analysis (daily_summary, weekly_trends, macro_breakdown, ingredient_analysis)
-#         date_range: Date range for analysis (e.g., 'last_7_days', 'this_week', 'YYYY-MM-DD to YYYY-MM-DD')
-#     """
-#     meals = parse_food_log()
+    calories = f"{fmt('calories', '.0f', '')} calories"
+    if calorie_share is not None:
+        calories += f" ({calorie_share:.1f}%)"
+    return (
+        f"{calories}, {fmt('protein_g', '.1f', 'g')} protein, "
+        f"{fmt('carbs_g', '.1f', 'g')} carbs, {fmt('fat_g', '.1f', 'g')} fat"
+    )
+
+
+@mcp.tool()
+def analyze_nutrition(
+    analysis_type: str,
+    date_range: Optional[str] = None
+) -> str:
+    """Analyze nutrition trends and provide insights from food log.
+    
+    Args:
+        analysis_type: Type of analysis (daily_summary, macro_breakdown, ingredient_analysis)
+        date_range: Date range for analysis ('YYYY-MM-DD' or 'YYYY-MM-DD to YYYY-MM-DD', optional)
+    """
+    meals = iter_food_log()
+    if date_range:
+        try:
+            start, end = _parse_date_range(date_range)
+        except ValueError:
+            return f"Invalid date_range '{date_range}': expected 'YYYY-MM-DD' or 'YYYY-MM-DD to YYYY-MM-DD'."
+        meals = (meal for meal in meals if meal.date and start <= meal.date <= end)
     
-#     if not meals:
-#         return "No food data available for analysis."
+    if analysis_type == "daily_summary":
+        rollup = aggregate_nutrients(meals)
+        if not rollup.per_meal:
+            return "No food data available for analysis."
+        
+        result = "Daily Nutrition Summary:\n\n"
+        for date, data in sorted(rollup.per_day.items()):
+            result += f"**{date}**: {_format_nutrients(data)} ({rollup.meals_per_day[date]} meals)\n"
+        return result
     
-#     if analysis_type == "daily_summary":
-#         # Group by date and calculate daily totals
-#         daily_data = {}
-#         for meal in meals:
-#             date = meal.date
-#             if date not in daily_data:
-#                 daily_data[date] = {"calories": 0, "protein": 0, "meals": 0}
-            
-#             daily_data[date]["calories"] += meal.total_calories or 0
-#             daily_data[date]["protein"] += meal.total_protein_g or 0
-#             daily_data[date]["meals"] += 1
+    elif analysis_type == "macro_breakdown":
+        # Per-category totals and shares, e.g. proportion of calories from meat
+        rollup = aggregate_nutrients(meals)
+        if not rollup.per_meal:
+            return "No food data available for analysis."
         
-#         result = "Daily Nutrition Summary:\n\n"
-#         for date, data in sorted(daily_data.items()):
-#             result += f"**{date}**: {data['calories']:.0f} calories, {data['protein']:.1f}g protein ({data['meals']} meals)\n"
-#         return result
+        total = rollup.total
+        result = f"Macro Breakdown ({len(rollup.per_meal)} meals): {_format_nutrients(total)}\n\n"
+        for category, data in sorted(rollup.per_category.items(), key=lambda x: x[1]["calories"] or 0, reverse=True):
+            share = None
+            if data["calories"] is not None and total["calories"]:
+                share = data["calories"] / total["calories"] * 100
+            result += f"**{category}**: {_format_nutrients(data, share)}\n"
+        return result
     
-#     elif analysis_type == "ingredient_analysis":
-#         # Analyze ingredient frequency and nutrition contribution
-#         ingredient_stats = {}
-#         for meal in meals:
-#             for ing in meal.ingredients:
-#                 name = ing.name
-#                 if name not in ingredient_stats:
-#                     ingredient_stats[name] = {"count": 0, "calories": 0, "protein": 0}
-                
-#                 ingredient_stats[name]["count"] += 1
-#                 ingredient_stats[name]["calories"] += ing.calories or 0
-#                 ingredient_stats[name]["protein"] += ing.protein_g or 0
+    elif analysis_type == "ingredient_analysis":
+        # Analyze ingredient frequency and nutrition contribution
+        rollup = aggregate_nutrients(meals)
+        if not rollup.per_meal:
+            return "No food data available for analysis."
         
-#         result = "Ingredient Analysis:\n\n"
-#         for ing, stats in sorted(ingredient_stats.items(), key=lambda x: x[1]["count"], reverse=True):
-#             result += f"**{ing}**: Used {stats['count']} times, {stats['calories']:.0f} total calories, {stats['protein']:.1f}g total protein\n"
-#         return result
+        result = "Ingredient Analysis:\n\n"
+        for ing, count in sorted(rollup.ingredient_counts.items(), key=lambda x: x[1], reverse=True):
+            data = rollup.per_ingredient[ing]
+            result += f"**{ing}**: Used {count} times, {_format_nutrients(data)}\n"
+        return result
     
-#     else:
-#         return f"Analysis type '{analysis_type}' not yet implemented."
+    else:
+        return f"Analysis type '{analysis_type}' not yet implemented."
 
 
 @mcp.tool()
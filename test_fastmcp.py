@@ -5,6 +5,7 @@ Simple test script to validate the FastMCP food server
 
 import tempfile
 import shutil
+from contextlib import contextmanager
 from pathlib import Path
 import sys
 import importlib.util
@@ -19,6 +20,8 @@ spec.loader.exec_module(mcp_module)
 
 add_meal_to_log = mcp_module.add_meal_to_log
 parse_food_log = mcp_module.parse_food_log
+get_food_log = mcp_module.get_food_log
+analyze_nutrition = mcp_module.analyze_nutrition
 
 def test_add_meal():
     """Test adding a meal to the log"""
@@ -34,13 +37,17 @@ def test_add_meal():
                 "name": "banana",
                 "category": "fruit",
                 "calories": 105,
-                "protein_g": 1.3
+                "protein_g": 1.3,
+                "carbs_g": 27.0,
+                "fat_g": 0.4
             },
             {
                 "name": "greek yogurt",
                 "category": "dairy",
                 "calories": 150,
-                "protein_g": 15.0
+                "protein_g": 15.0,
+                "carbs_g": 6.0,
+                "fat_g": 4.0
             }
         ]
     }
@@ -58,6 +65,244 @@ def test_add_meal():
         print(f"Latest meal: {latest_meal.meal_type} on {latest_meal.date}")
         print(f"Ingredients: {[ing.name for ing in latest_meal.ingredients]}")
 
+@contextmanager
+def temporary_food_log():
+    """Point the server at an empty food log in a temporary directory"""
+    original = (mcp_module.FOOD_LOG_FILE, mcp_module.FOOD_LOG_INDEX_FILE)
+    tmp_dir = Path(tempfile.mkdtemp())
+    mcp_module.FOOD_LOG_FILE = tmp_dir / "food_log.md"
+    mcp_module.FOOD_LOG_INDEX_FILE = tmp_dir / "food_log.index"
+    mcp_module.FOOD_LOG_FILE.write_text("# Food Log\n\n")
+    mcp_module._meal_index = None
+    mcp_module._meal_index_stamp = None
+    try:
+        yield tmp_dir
+    finally:
+        mcp_module.FOOD_LOG_FILE, mcp_module.FOOD_LOG_INDEX_FILE = original
+        mcp_module._meal_index = None
+        mcp_module._meal_index_stamp = None
+        shutil.rmtree(tmp_dir)
+
+SNACK = {
+    "query": "I had an apple for a snack",
+    "meal_type": "snack",
+    "date": "2025-01-15",
+    "time": "15:00",
+    "ingredients": [
+        {"name": "apple", "category": "fruit", "calories": 95, "protein_g": 0.5}
+    ]
+}
+
+def test_duplicate_meal():
+    """Test that retrying the same meal does not append a second entry"""
+    print("\nTesting duplicate detection...")
+    
+    with temporary_food_log():
+        assert add_meal_to_log(dict(SNACK)).startswith("Successfully logged")
+        result = add_meal_to_log(dict(SNACK))
+        print(f"Retry result: {result}")
+        assert "duplicate skipped" in result
+        assert len(parse_food_log()) == 1
+
+def test_meal_hash_round_trip():
+    """Test that the hash of a tool call matches the hash of the parsed entry"""
+    print("\nTesting hash round trip...")
+    
+    meal_data = dict(SNACK, meal_type=None, ingredients=[{"name": "apple", "calories": None}])
+    with temporary_food_log():
+        add_meal_to_log(meal_data)
+        meal = parse_food_log()[0]
+        expected = mcp_module.meal_content_hash(
+            "I had an apple for a snack", "", "2025-01-15", "15:00", meal_data["ingredients"]
+        )
+        assert mcp_module._meal_digests(meal) == [expected]
+        
+        # A retry after the index is rebuilt from the log is still a no-op
+        mcp_module.rebuild_meal_index()
+        assert "duplicate skipped" in add_meal_to_log(meal_data)
+        assert len(parse_food_log()) == 1
+    
+    padded = dict(SNACK, query="  apple ")
+    with temporary_food_log():
+        add_meal_to_log(padded)
+        assert parse_food_log()[0].query == '"apple"'
+        mcp_module.rebuild_meal_index()
+        assert "duplicate skipped" in add_meal_to_log(padded)
+        assert len(parse_food_log()) == 1
+
+def test_idempotency_key():
+    """Test that reusing an idempotency key skips the entry"""
+    print("\nTesting idempotency keys...")
+    
+    with temporary_food_log():
+        add_meal_to_log(dict(SNACK, idempotency_key="req-1"))
+        result = add_meal_to_log(dict(SNACK, time="15:05", idempotency_key="req-1"))
+        assert "duplicate skipped" in result
+        assert parse_food_log()[0].idempotency_key == "req-1"
+        
+        # The key survives an index rebuild
+        mcp_module.rebuild_meal_index()
+        assert "duplicate skipped" in add_meal_to_log(dict(SNACK, time="15:10", idempotency_key="req-1"))
+        assert len(parse_food_log()) == 1
+
+def test_stale_index_is_rebuilt():
+    """Test that editing the log by hand invalidates the index"""
+    print("\nTesting stale index detection...")
+    
+    with temporary_food_log():
+        add_meal_to_log(dict(SNACK))
+        mcp_module.FOOD_LOG_FILE.write_text("# Food Log\n\n")
+        assert add_meal_to_log(dict(SNACK)).startswith("Successfully logged")
+        assert len(parse_food_log()) == 1
+        
+        # A fresh process reading the persisted index sees the same state
+        mcp_module._meal_index = None
+        assert "duplicate skipped" in add_meal_to_log(dict(SNACK))
+
+def test_unterminated_block():
+    """Test that a block missing MEAL END does not swallow the next meal"""
+    print("\nTesting unterminated meal blocks...")
+    
+    with temporary_food_log():
+        add_meal_to_log(dict(SNACK))
+        add_meal_to_log(dict(SNACK, date="2025-01-16"))
+        content = mcp_module.FOOD_LOG_FILE.read_text()
+        mcp_module.FOOD_LOG_FILE.write_text(content.replace("### MEAL END", "", 1))
+        assert [meal.date for meal in parse_food_log()] == ["2025-01-15", "2025-01-16"]
+        assert mcp_module.remove_duplicate_meals() == []
+        assert len(parse_food_log()) == 2
+
+def test_remove_duplicate_meals():
+    """Test reporting and removing duplicates already in the log"""
+    print("\nTesting duplicate removal...")
+    
+    with temporary_food_log() as tmp_dir:
+        add_meal_to_log(dict(SNACK))
+        entry = mcp_module.FOOD_LOG_FILE.read_text().split("# Food Log\n\n", 1)[1]
+        with open(mcp_module.FOOD_LOG_FILE, "a") as f:
+            f.write(entry)
+        assert len(parse_food_log()) == 2
+        
+        duplicates = mcp_module.remove_duplicate_meals(dry_run=True)
+        assert len(duplicates) == 1
+        assert len(parse_food_log()) == 2
+        assert sorted(p.name for p in tmp_dir.iterdir()) == ["food_log.index", "food_log.md"]
+        
+        duplicates = mcp_module.remove_duplicate_meals()
+        assert len(duplicates) == 1
+        assert len(parse_food_log()) == 1
+        assert mcp_module.remove_duplicate_meals(dry_run=True) == []
+
+LEGACY_ENTRY = """
+### MEAL START
+**Query:** "I had a homemade chicken sandwich for lunch"
+**Meal:** Lunch
+**Date:** 2025-09-03
+**Time:** 12:45
+**Total Calories:** 347
+**Total Protein (g):** 41
+
+| Ingredient         | Category | Calories | Protein (g) |
+|--------------------|----------|----------|-------------|
+| Chicken Breast (4oz) | Meat     | 187      | 35          |
+| Bread (2 slices)   | Grain    | 160      | 6           |
+### MEAL END
+"""
+
+def test_legacy_table_parses():
+    """Test that four-column entries parse with carbs/fat left unknown"""
+    print("\nTesting legacy table format...")
+    
+    with temporary_food_log():
+        with open(mcp_module.FOOD_LOG_FILE, "a") as f:
+            f.write(LEGACY_ENTRY)
+        meal = parse_food_log()[0]
+        assert [ing.name for ing in meal.ingredients] == ["Chicken Breast (4oz)", "Bread (2 slices)"]
+        assert meal.ingredients[0].calories == 187.0
+        assert meal.ingredients[0].protein_g == 35.0
+        assert all(ing.carbs_g is None and ing.fat_g is None for ing in meal.ingredients)
+        assert meal.total_carbs_g is None and meal.total_fat_g is None
+
+def test_macro_round_trip():
+    """Test that all macros survive a write and parse, and unknowns stay None"""
+    print("\nTesting macro persistence...")
+    
+    meal_data = dict(SNACK, ingredients=[
+        {"name": "ribeye", "category": "meat", "calories": 500, "protein_g": 40, "carbs_g": 0, "fat_g": 38},
+        {"name": "butter", "category": "fat", "calories": 100, "fat_g": 11.5},
+    ])
+    with temporary_food_log():
+        add_meal_to_log(meal_data)
+        meal = parse_food_log()[0]
+        ribeye, butter = meal.ingredients
+        assert (ribeye.calories, ribeye.protein_g, ribeye.carbs_g, ribeye.fat_g) == (500.0, 40.0, 0.0, 38.0)
+        assert (butter.protein_g, butter.carbs_g, butter.fat_g) == (None, None, 11.5)
+        assert (meal.total_calories, meal.total_protein_g, meal.total_carbs_g, meal.total_fat_g) == (600.0, 40.0, 0.0, 49.5)
+        
+        # Meals logged without carbs/fat keep those totals unknown
+        add_meal_to_log(dict(SNACK))
+        meal = parse_food_log()[1]
+        assert meal.total_carbs_g is None and meal.total_fat_g is None
+        assert "Carbs" not in get_food_log(limit=1)
+        
+        # Ingredients with no values or no name are kept
+        add_meal_to_log(dict(SNACK, ingredients=[{"name": ""}, {"name": "water"}]))
+        meal = parse_food_log()[2]
+        assert [ing.name for ing in meal.ingredients] == ["", "water"]
+        assert meal.total_calories is None and meal.total_protein_g is None
+        assert "None" not in get_food_log(limit=1)
+        mcp_module.rebuild_meal_index()
+        assert "duplicate skipped" in add_meal_to_log(dict(SNACK, ingredients=[{"name": ""}, {"name": "water"}]))
+
+def test_aggregate_nutrients():
+    """Test that per-meal, per-day, per-category and per-ingredient totals agree"""
+    print("\nTesting nutrient rollups...")
+    
+    with temporary_food_log():
+        with open(mcp_module.FOOD_LOG_FILE, "a") as f:
+            f.write(LEGACY_ENTRY)
+        add_meal_to_log(dict(SNACK, date="2025-09-03", ingredients=[
+            {"name": "ribeye", "category": "Meat", "calories": 500, "protein_g": 40, "carbs_g": 0, "fat_g": 38},
+            {"name": "butter", "category": "Fat", "calories": 100, "fat_g": 11.5},
+        ]))
+        add_meal_to_log(dict(SNACK, date="2025-09-04"))
+        
+        rollup = mcp_module.aggregate_nutrients(mcp_module.iter_food_log())
+        assert len(rollup.per_meal) == 3
+        assert rollup.total == {"calories": 1042.0, "protein_g": 81.5, "carbs_g": 0.0, "fat_g": 49.5}
+        assert rollup.per_category["Meat"]["calories"] == 687.0
+        assert rollup.per_day["2025-09-03"]["fat_g"] == 49.5
+        assert rollup.meals_per_day == {"2025-09-03": 2, "2025-09-04": 1}
+        assert rollup.ingredient_counts["ribeye"] == 1
+        for field in mcp_module.NUTRIENT_FIELDS:
+            for group in (rollup.per_meal, rollup.per_day.values(), rollup.per_category.values(), rollup.per_ingredient.values()):
+                known = [totals[field] for totals in group if totals[field] is not None]
+                assert abs(sum(known) - rollup.total[field]) < 1e-9
+        
+        breakdown = analyze_nutrition("macro_breakdown")
+        assert "**Meat**: 687 calories (65.9%)" in breakdown
+        assert "**Fat**: 100 calories (9.6%)" in breakdown
+        assert "2025-09-04" not in analyze_nutrition("daily_summary", "2025-09-03")
+        assert "11.5g fat" in analyze_nutrition("ingredient_analysis")
+        assert analyze_nutrition("daily_summary", "last_7_days").startswith("Invalid date_range")
+
+def test_aggregate_unknown_macros():
+    """Test that macros missing from every entry are reported as unknown, not 0"""
+    print("\nTesting rollups over legacy entries...")
+    
+    with temporary_food_log():
+        with open(mcp_module.FOOD_LOG_FILE, "a") as f:
+            f.write(LEGACY_ENTRY)
+        
+        rollup = mcp_module.aggregate_nutrients(mcp_module.iter_food_log())
+        assert rollup.total == {"calories": 347.0, "protein_g": 41.0, "carbs_g": None, "fat_g": None}
+        assert rollup.per_day["2025-09-03"]["carbs_g"] is None
+        assert rollup.per_category["Meat"] == {"calories": 187.0, "protein_g": 35.0, "carbs_g": None, "fat_g": None}
+        
+        summary = analyze_nutrition("daily_summary")
+        assert "347 calories, 41.0g protein, unknown carbs, unknown fat" in summary
+        assert "**Meat**: 187 calories (53.9%), 35.0g protein, unknown carbs, unknown fat" in analyze_nutrition("macro_breakdown")
+
 def test_basic_functions():
     """Test the basic functions work independently"""
     print("\n" + "="*50)
@@ -105,6 +350,16 @@ if __name__ == "__main__":
     print("=" * 50)
     
     test_add_meal()
+    test_duplicate_meal()
+    test_meal_hash_round_trip()
+    test_idempotency_key()
+    test_stale_index_is_rebuilt()
+    test_unterminated_block()
+    test_remove_duplicate_meals()
+    test_legacy_table_parses()
+    test_macro_round_trip()
+    test_aggregate_nutrients()
+    test_aggregate_unknown_macros()
     test_basic_functions()
     
     print("\n" + "="*50)